@@ -192,7 +192,15 @@ if __name__ == "__main__":
     print("✓ Takes longer (2 images per page) but guaranteed to work\n")
     
     # List story files
-    story_files = list(Path('stories').glob('*.json'))
+    # Newest first; DirEntry.stat() reuses the data from the directory scan
+    story_files = []
+    if os.path.isdir('stories'):
+        with os.scandir('stories') as entries:
+            story_files = sorted(
+                (entry for entry in entries if entry.name.endswith('.json')),
+                key=lambda entry: entry.stat().st_mtime,
+                reverse=True
+            )
     
     if not story_files:
         print("No story files found in stories/ folder!")
@@ -203,24 +211,29 @@ if __name__ == "__main__":
         print(f"  {i}. {story.name}")
     
     print("\nEnter story number to generate images for:")
-    choice = int(input("> "))
-    
-    if 1 <= choice <= len(story_files):
-        selected_story = story_files[choice - 1]
-        print(f"\nGenerating images for: {selected_story.name}")
-        print("\nNote: This generates 2 images per page (one per character)")
-        print("      then composites them together.")
-        print("      Cost: ~2x normal generation (~$0.06-0.10 per page)\n")
-        
-        input("Press Enter to continue...")
-        
-        generator.generate_all_story_images(str(selected_story))
-        
-        print("\n" + "="*60)
-        print("GENERATION COMPLETE!")
-        print("="*60)
-        print("\nEach image shows both characters without interference.")
-        print("Characters should look exactly like their individual test images!")
-        print("="*60)
-    else:
-        print("Invalid choice!")
\ No newline at end of file
+    # story_files is built once above; a bad entry just re-prompts
+    while True:
+        try:
+            choice = int(input("> "))
+        except ValueError:
+            choice = 0
+        if 1 <= choice <= len(story_files):
+            break
+        print(f"Invalid choice! Enter a number from 1 to {len(story_files)}")
+    
+    selected_story = story_files[choice - 1]
+    print(f"\nGenerating images for: {selected_story.name}")
+    print("\nNote: This generates 2 images per page (one per character)")
+    print("      then composites them together.")
+    print("      Cost: ~2x normal generation (~$0.06-0.10 per page)\n")
+    
+    input("Press Enter to continue...")
+    
+    generator.generate_all_story_images(selected_story.path)
+    
+    print("\n" + "="*60)
+    print("GENERATION COMPLETE!")
+    print("="*60)
+    print("\nEach image shows both characters without interference.")
+    print("Characters should look exactly like their individual test images!")
+    print("="*60)
\ No newline at end of file
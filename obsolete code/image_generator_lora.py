@@ -242,7 +242,15 @@ if __name__ == "__main__":
     print("with improved scene accuracy and error prevention!\n")
     
     # List story files
-    story_files = list(Path('stories').glob('*.json'))
+    # Newest first; DirEntry.stat() reuses the data from the directory scan
+    story_files = []
+    if os.path.isdir('stories'):
+        with os.scandir('stories') as entries:
+            story_files = sorted(
+                (entry for entry in entries if entry.name.endswith('.json')),
+                key=lambda entry: entry.stat().st_mtime,
+                reverse=True
+            )
     
     if not story_files:
         print("No story files found in stories/ folder!")
@@ -253,28 +261,33 @@ if __name__ == "__main__":
         print(f"  {i}. {story.name}")
     
     print("\nEnter story number to generate images for:")
-    choice = int(input("> "))
+    # story_files is built once above; a bad entry just re-prompts
+    while True:
+        try:
+            choice = int(input("> "))
+        except ValueError:
+            choice = 0
+        if 1 <= choice <= len(story_files):
+            break
+        print(f"Invalid choice! Enter a number from 1 to {len(story_files)}")
+    
+    selected_story = story_files[choice - 1]
+    print(f"\nGenerating images for: {selected_story.name}")
+    generator.generate_all_story_images(selected_story.path)
     
-    if 1 <= choice <= len(story_files):
-        selected_story = story_files[choice - 1]
-        print(f"\nGenerating images for: {selected_story.name}")
-        generator.generate_all_story_images(str(selected_story))
-        
-        print("\n" + "="*60)
-        print("REVIEW YOUR IMAGES!")
-        print("="*60)
-        print("\nCheck the images folder for any issues:")
-        print("- Wrong character doing action? Regenerate that page")
-        print("- Extra limbs or deformities? Regenerate that page")
-        print("- Scene doesn't match story? Regenerate that page")
-        print("\nTo regenerate a specific page:")
-        print("  python")
-        print("  >>> from image_generator_lora import LoRAImageGenerator")
-        print("  >>> from dotenv import load_dotenv")
-        print("  >>> import os")
-        print("  >>> load_dotenv()")
-        print("  >>> gen = LoRAImageGenerator(os.getenv('FAL_API_KEY'))")
-        print(f"  >>> gen.regenerate_single_page('{selected_story}', PAGE_NUMBER)")
-        print("="*60)
-    else:
-        print("Invalid choice!")
\ No newline at end of file
+    print("\n" + "="*60)
+    print("REVIEW YOUR IMAGES!")
+    print("="*60)
+    print("\nCheck the images folder for any issues:")
+    print("- Wrong character doing action? Regenerate that page")
+    print("- Extra limbs or deformities? Regenerate that page")
+    print("- Scene doesn't match story? Regenerate that page")
+    print("\nTo regenerate a specific page:")
+    print("  python")
+    print("  >>> from image_generator_lora import LoRAImageGenerator")
+    print("  >>> from dotenv import load_dotenv")
+    print("  >>> import os")
+    print("  >>> load_dotenv()")
+    print("  >>> gen = LoRAImageGenerator(os.getenv('FAL_API_KEY'))")
+    print(f"  >>> gen.regenerate_single_page('{selected_story.path}', PAGE_NUMBER)")
+    print("="*60)
\ No newline at end of file
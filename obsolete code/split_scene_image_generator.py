@@ -325,7 +325,15 @@ if __name__ == "__main__":
     print("\n")
     
     # List story files
-    story_files = list(Path('stories').glob('*.json'))
+    # Newest first; DirEntry.stat() reuses the data from the directory scan
+    story_files = []
+    if os.path.isdir('stories'):
+        with os.scandir('stories') as entries:
+            story_files = sorted(
+                (entry for entry in entries if entry.name.endswith('.json')),
+                key=lambda entry: entry.stat().st_mtime,
+                reverse=True
+            )
     
     if not story_files:
         print("No story files found in stories/ folder!")
@@ -336,33 +344,38 @@ if __name__ == "__main__":
         print(f"  {i}. {story.name}")
     
     print("\nEnter story number to generate images for:")
-    choice = int(input("> "))
+    # story_files is built once above; a bad entry just re-prompts
+    while True:
+        try:
+            choice = int(input("> "))
+        except ValueError:
+            choice = 0
+        if 1 <= choice <= len(story_files):
+            break
+        print(f"Invalid choice! Enter a number from 1 to {len(story_files)}")
     
-    if 1 <= choice <= len(story_files):
-        selected_story = story_files[choice - 1]
-        print(f"\nGenerating images for: {selected_story.name}")
-        
-        # Count pages properly
-        with open(selected_story, 'r') as f:
-            story_data = json.load(f)
-        num_pages = len(story_data['pages'])
-        
-        print("\nThis will:")
-        print("  - Split each scene into character-specific descriptions")
-        print("  - Generate 2 images per page (one per character)")
-        print("  - Composite them side-by-side")
-        print(f"  - Total: {num_pages} pages\n")
-        
-        input("Press Enter to continue...")
-        
-        generator.generate_all_story_images(str(selected_story))
-        
-        print("\n" + "="*60)
-        print("GENERATION COMPLETE!")
-        print("="*60)
-        print("\nEach character should now appear correctly in their own space!")
-        print("Check the images folder - you'll also find _descriptions.json")
-        print("files showing how each scene was split.")
-        print("="*60)
-    else:
-        print("Invalid choice!")
\ No newline at end of file
+    selected_story = story_files[choice - 1]
+    print(f"\nGenerating images for: {selected_story.name}")
+    
+    # Count pages properly
+    with open(selected_story.path, 'r') as f:
+        story_data = json.load(f)
+    num_pages = len(story_data['pages'])
+    
+    print("\nThis will:")
+    print("  - Split each scene into character-specific descriptions")
+    print("  - Generate 2 images per page (one per character)")
+    print("  - Composite them side-by-side")
+    print(f"  - Total: {num_pages} pages\n")
+    
+    input("Press Enter to continue...")
+    
+    generator.generate_all_story_images(selected_story.path)
+    
+    print("\n" + "="*60)
+    print("GENERATION COMPLETE!")
+    print("="*60)
+    print("\nEach character should now appear correctly in their own space!")
+    print("Check the images folder - you'll also find _descriptions.json")
+    print("files showing how each scene was split.")
+    print("="*60)
\ No newline at end of file
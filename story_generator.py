@@ -1,19 +1,166 @@
 import os
+import re
 import json
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+# Common color words to extract from outfit descriptions, matched in one pass
+OUTFIT_COLORS = ('black', 'white', 'red', 'blue', 'green', 'yellow', 'purple',
+                 'brown', 'grey', 'gray', 'silver', 'gold', 'golden', 'dark',
+                 'light', 'deep', 'bright')
+_COLOR_RE = re.compile(r'\b(' + '|'.join(OUTFIT_COLORS) + r')\b', re.IGNORECASE)
+
+# Pronoun starting a sentence in a scene description
+_PRONOUN_RE = re.compile(r'\. (She|He|Her|His) ')
+
+# Position phrases in scene descriptions and how they read in the scene prompt
+POSITION_LABELS = {
+    'on the left': 'on the left',
+    'on the right': 'on the right',
+    'center': 'in the center',
+    'foreground': 'in the foreground',
+    'background': 'in the background'
+}
+
+# Sentences mentioning any of these count as setting description
+SETTING_KEYWORDS = (
+    'forest', 'clearing', 'village', 'temple', 'ruins', 'cave',
+    'lighting', 'sunlight', 'shadows', 'atmosphere', 'mood',
+    'cinematic', 'illustration', 'fantasy', 'dramatic'
+)
+_SETTING_RE = re.compile('|'.join(map(re.escape, SETTING_KEYWORDS)))
+
+# Per-page fields Gemini fills in alongside the scene description. When all of
+# them are present, build_page_prompts uses them instead of parsing the scene.
+SCENE_BREAKDOWN_FIELDS = ('character_1_action', 'character_2_action', 'environment', 'positioning')
+
+# Example block for the story prompt; names are filled in once per generator
+EXAMPLE_TEMPLATE = """EXAMPLE of a good scene_description:
+"{c2} stands in the foreground on the left, holding a glowing sword raised high in her right hand, shield on her left arm. {c1} crouches to the right in the background, daggers drawn, watching the shadows. Ancient stone temple interior, torchlight casting dramatic shadows, tense atmosphere."
+"{c2} wears her paladin armor and has a gentle smile."
+"{c1}'s Lightning Dagger is clipped to his belt, crackling faintly."
+
+BAD scene_description (too vague):
+"The heroes face danger in the temple"
+"She wears her paladin armor and has a gentle smile."
+"His Lightning Dagger is clipped to his belt, crackling faintly."
+
+Include character names, specific positions, and explicit actions in EVERY scene description!"""
+
+# Everything the model needs besides the per-call story request
+SYSTEM_INSTRUCTION_TEMPLATE = """{character_context}
+You write exciting high fantasy adventure stories featuring these two characters.
+Each story should be suitable for display as a picture book with 10-12 pages.
+
+REQUIREMENTS:
+- Write exactly 10 distinct scenes/pages
+- Each page should be 2-3 sentences of narrative
+- Each page should be a clear, visually distinct scene
+- Show the characters' personalities and their relationship dynamic
+- Include character-appropriate actions (their quirks, fighting styles, etc.)
+- Build to a satisfying conclusion
+- Use vivid, descriptive language suitable for image generation
+
+IMPORTANT: Make sure the story reflects their personalities:
+- {char1_name}'s cautious but curious nature, love of fine things, trust issues
+- {char2_name}'s protective caring nature, connection to nature/deity, maternal strength
+- Their contrasting approaches but strong partnership
+
+Format your response as a JSON array with this structure:
+[
+  {{
+    "page": 1,
+    "text": "The narrative text for this page (2-3 sentences)",
+    "scene_description": "Detailed visual description of the scene for image generation. ",
+    "character_1_action": "What {char1_name} is doing, holding and wearing in this scene, without their name",
+    "character_2_action": "What {char2_name} is doing, holding and wearing in this scene, without their name",
+    "environment": "The setting, lighting and mood only, with no character actions",
+    "positioning": "Where each character is, e.g. {char1_name} on the right, {char2_name} on the left"
+  }},
+  ...
+]
+
+CRITICAL: The scene_description must be EXTREMELY EXPLICIT and detailed:
+- State EXACTLY which character is doing what action (use their names: {char1_name} or {char2_name})
+- Do not use personal pronouns without referencing the character's name in the same sentence.
+- Describe WHERE each character is positioned (left/right/center, foreground/background)
+- Specify WHAT each character is holding or wearing
+- Describe the setting, lighting, and mood
+- Be precise about body positions and actions
+- If a character holds a weapon, specify WHICH character and WHICH hand
+
+{example_block}"""
+
+STORY_REQUEST = "Write an exciting high fantasy adventure story featuring these two characters."
+
+def _load_json(file_path):
+    """Read a JSON file with a single bytes read and parse it directly"""
+    return json.loads(Path(file_path).read_bytes())
+
 class StoryGenerator:
     def __init__(self, api_key, characters_file='characters.json', lora_config_file='lora_config.json'):
         self.api_key = api_key
+        
+        # One pooled session for every Gemini call, so later stories reuse the
+        # open connection instead of paying DNS + TCP + TLS again. Rate limits
+        # and transient server errors are retried with exponential backoff
+        # (honouring Retry-After) so a 429 doesn't throw away the whole run.
+        self._session = requests.Session()
+        retries = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['POST'],
+            # Hand back the last response once retries run out, so the error
+            # below can report Gemini's message instead of a bare RetryError
+            raise_on_status=False
+        )
+        self._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
         self.characters = self.load_characters(characters_file)
         self.loras = self.load_lora_config(lora_config_file)
         
+        # The characters never change per instance, so everything derived from
+        # them is built once here rather than on every story or page
+        self._character_context = self._build_character_context()
+        self._char_static = self._build_char_static()
+        self._example_block = EXAMPLE_TEMPLATE.format(
+            c1=self._char_static['char1_name'],
+            c2=self._char_static['char2_name']
+        )
+        
+        self._system_instruction = SYSTEM_INSTRUCTION_TEMPLATE.format(
+            character_context=self._character_context,
+            char1_name=self._char_static['char1_name'],
+            char2_name=self._char_static['char2_name'],
+            example_block=self._example_block
+        )
+        
+        # Sentence-initial pronouns and the name each stands for in scene descriptions
+        self._pronoun_names = {
+            'She': self._char_static['char2_name'],
+            'He': self._char_static['char1_name'],
+            'Her': f"{self._char_static['char2_name']}'s",
+            'His': f"{self._char_static['char1_name']}'s"
+        }
+        
+        # Either character's name or a position phrase, so one scan over the
+        # already-lowercased scene description finds both in order; a name
+        # match never spans a phrase (or the other name) following it
+        char_names = '|'.join(re.escape(self._char_static[key]) for key in ('char1_name_lower', 'char2_name_lower'))
+        positions = '|'.join(POSITION_LABELS)
+        self._position_re = re.compile(rf"({char_names})\b|\b({positions})")
+        
+        # build_page_prompts specialized to these two characters
+        self._page_prompt_builder = self._specialize_for_story()
+        
     def load_characters(self, file_path):
         """Load character profiles from JSON file"""
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        return _load_json(file_path)
     
     def load_lora_config(self, file_path):
         """Load LoRA configuration with trigger words and strengths"""
@@ -36,11 +183,14 @@ class StoryGenerator:
                 }
             }
         
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        return _load_json(file_path)
     
     def format_characters_for_prompt(self):
         """Format character data for the LLM prompt"""
+        return self._character_context
+    
+    def _build_character_context(self):
+        """Build the character profile text used in the LLM prompt"""
         char_text = "CHARACTER PROFILES:\n\n"
         
         # Character 1
@@ -120,6 +270,33 @@ class StoryGenerator:
         
         return char_text
     
+    def _build_char_static(self):
+        """Precompute the per-character values that build_page_prompts uses on every page"""
+        char_static = {}
+        
+        for prefix, char_key, default_name, default_strength in (
+            ('char1', 'character_1', 'Character 1', 0.8),
+            ('char2', 'character_2', 'Character 2', 0.75),
+        ):
+            char = self.characters.get(char_key, {})
+            name = char.get('fantasy_name', default_name)
+            
+            # Get LoRA information
+            lora = self.loras.get(name, {})
+            
+            # Get visual design information for outfit cues
+            visual = char.get('visual_design', {})
+            
+            char_static[f'{prefix}_name'] = name
+            char_static[f'{prefix}_name_lower'] = name.lower()
+            char_static[f'{prefix}_trigger'] = lora.get('trigger_word', name.lower().replace(' ', '_'))
+            char_static[f'{prefix}_lora_file'] = os.path.splitext(lora.get('lora_filename', f"{name.replace(' ', '')}.safetensors"))[0]
+            char_static[f'{prefix}_strength'] = lora.get('default_strength', default_strength)
+            char_static[f'{prefix}_outfit_cue'] = self._extract_outfit_colors(visual.get('prompt_palette', ''))
+            char_static[f'{prefix}_prompt_keywords'] = self._extract_outfit_colors(visual.get('prompt_keywords', ''))
+        
+        return char_static
+    
     def build_page_prompts(self, page_data):
         """
         Build separate prompts for each character and the scene based on page data.
@@ -130,158 +307,183 @@ class StoryGenerator:
         Returns:
             Dictionary with character_1_prompt, character_2_prompt, scene_prompt, negative_prompt
         """
-        char1 = self.characters['character_1']
-        char2 = self.characters['character_2']
-        
-        char1_name = char1['fantasy_name']
-        char2_name = char2['fantasy_name']
-        
-        # Get LoRA information
-        char1_lora = self.loras.get(char1_name, {})
-        char2_lora = self.loras.get(char2_name, {})
-        
-        char1_trigger = char1_lora.get('trigger_word', char1_name.lower().replace(' ', '_'))
-        char2_trigger = char2_lora.get('trigger_word', char2_name.lower().replace(' ', '_'))
-        
-        char1_lora_file = os.path.splitext(char1_lora.get('lora_filename', f"{char1_name.replace(' ', '')}.safetensors"))[0]
-        char2_lora_file = os.path.splitext(char2_lora.get('lora_filename', f"{char2_name.replace(' ', '')}.safetensors"))[0]
-        
-        char1_strength = char1_lora.get('default_strength', 0.8)
-        char2_strength = char2_lora.get('default_strength', 0.75)
-        
-        # Get visual design information for outfit cues
-        char1_visual = char1.get('visual_design', {})
-        char2_visual = char2.get('visual_design', {})
-        
-        char1_outfit_cue = self._extract_outfit_colors(char1_visual.get('prompt_palette', ''))
-        char2_outfit_cue = self._extract_outfit_colors(char2_visual.get('prompt_palette', ''))
-        
-        char1_prompt_keywords = self._extract_outfit_colors(char1_visual.get('prompt_keywords', ''))
-        char2_prompt_keywords = self._extract_outfit_colors(char2_visual.get('prompt_keywords', ''))
-        
-        # Extract action/pose information from scene_description and text
-        scene_desc = page_data.get('scene_description', '')
-
-        scene_desc = scene_desc.replace(". She ", f". {char2_name} ")
-        scene_desc = scene_desc.replace(". He ", f". {char1_name} ")
-        scene_desc = scene_desc.replace(". Her ", f". {char2_name}'s ")
-        scene_desc = scene_desc.replace(". His ", f". {char1_name}'s ")
-
-        page_text = page_data.get('text', '')
+        return self._page_prompt_builder(page_data)
+    
+    def _specialize_for_story(self):
+        """
+        Return a build_page_prompts implementation specialized for this generator's characters
         
-        # Parse scene description to extract character-specific actions
-        char1_action, char2_action, environment_desc, positioning = self._parse_scene_description(
-            scene_desc, page_text, char1_name, char2_name
-        )
+        Everything that is the same on every page is bound to closure locals
+        up front, so the per-page path reads fast locals instead of walking
+        self._char_static and attribute chains ten times per story.
+        """
+        static = self._char_static
         
-        # Build character prompts
-        character_1_prompt = self._build_character_prompt(
-            char1_lora_file, char1_strength, char1_trigger, 
-            char1_name, char1_action, char1_outfit_cue, char1_prompt_keywords
-        )
+        char1_name = static['char1_name']
+        char2_name = static['char2_name']
         
-        character_2_prompt = self._build_character_prompt(
-            char2_lora_file, char2_strength, char2_trigger,
-            char2_name, char2_action, char2_outfit_cue, char2_prompt_keywords
-        )
+        char1_prompt_args = (static['char1_lora_file'], static['char1_strength'], static['char1_trigger'], char1_name)
+        char2_prompt_args = (static['char2_lora_file'], static['char2_strength'], static['char2_trigger'], char2_name)
+        char1_outfit_cue, char1_prompt_keywords = static['char1_outfit_cue'], static['char1_prompt_keywords']
+        char2_outfit_cue, char2_prompt_keywords = static['char2_outfit_cue'], static['char2_prompt_keywords']
         
-        # Build scene prompt
-        scene_prompt = self._build_scene_prompt(
-            environment_desc, positioning, char1_name, char2_name
-        )
+        replace_pronouns = _PRONOUN_RE.sub
+        replace_pronoun = self._replace_pronoun
+        parse_scene_description = self._parse_scene_description
+        build_character_prompt = self._build_character_prompt
+        build_scene_prompt = self._build_scene_prompt
         
         # Standard negative prompt
         negative_prompt = "low quality, blurry, extra people, watermark, text, deformed, bad anatomy, multiple faces, distorted perspective"
         
-        return {
-            'character_1_prompt': character_1_prompt,
-            'character_2_prompt': character_2_prompt,
-            'scene_prompt': scene_prompt,
-            'negative_prompt': negative_prompt
-        }
+        def build_page_prompts(page_data):
+            if all(page_data.get(field) for field in SCENE_BREAKDOWN_FIELDS):
+                # Gemini already split the scene per character in the same response
+                char1_action = page_data['character_1_action']
+                char2_action = page_data['character_2_action']
+                environment_desc = page_data['environment']
+                positioning = page_data['positioning']
+            else:
+                # Extract action/pose information from scene_description and text
+                scene_desc = page_data.get('scene_description', '')
+                
+                # Swap sentence-initial pronouns for names in one pass
+                scene_desc = replace_pronouns(replace_pronoun, scene_desc)
+                
+                page_text = page_data.get('text', '')
+                
+                # Parse scene description to extract character-specific actions
+                # Lowercase once here; the parser reuses it for every check
+                char1_action, char2_action, environment_desc, positioning = parse_scene_description(
+                    scene_desc, scene_desc.lower(), page_text, char1_name, char2_name
+                )
+            
+            return {
+                'character_1_prompt': build_character_prompt(
+                    *char1_prompt_args, char1_action, char1_outfit_cue, char1_prompt_keywords
+                ),
+                'character_2_prompt': build_character_prompt(
+                    *char2_prompt_args, char2_action, char2_outfit_cue, char2_prompt_keywords
+                ),
+                'scene_prompt': build_scene_prompt(
+                    environment_desc, positioning, char1_name, char2_name
+                ),
+                'negative_prompt': negative_prompt
+            }
+        
+        return build_page_prompts
+    
+    def _replace_pronoun(self, match):
+        """re.sub callback: turn '. She ' etc. into the matching character's name"""
+        return f". {self._pronoun_names[match.group(1)]} "
     
     def _extract_outfit_colors(self, outfit_description):
         """Extract color cues from outfit description"""
-        # Common color words to extract
-        colors = ['black', 'white', 'red', 'blue', 'green', 'yellow', 'purple', 
-                  'brown', 'grey', 'gray', 'silver', 'gold', 'golden', 'dark', 
-                  'light', 'deep', 'bright']
-        
-        outfit_lower = outfit_description.lower()
-        found_colors = [color for color in colors if color in outfit_lower]
+        # Whole words only, in order of appearance, without repeats
+        found_colors = list(dict.fromkeys(
+            color.lower() for color in _COLOR_RE.findall(outfit_description)
+        ))
         
         if found_colors:
             return ', '.join(found_colors) + ' clothing'
         return ''
     
-    def _parse_scene_description(self, scene_desc, page_text, char1_name, char2_name):
+    def _parse_scene_description(self, scene_desc, scene_lower, page_text, char1_name, char2_name):
         """
         Parse the scene description to extract character actions and environment.
         
+        Sentences are routed to the character actions and/or the environment
+        in a single walk over the text. scene_lower is scene_desc.lower(),
+        computed once by the caller.
+        
         Returns:
             tuple: (char1_action, char2_action, environment_desc, positioning)
         """
         # This is a simplified parser - in production, you might use more sophisticated NLP
-        scene_lower = scene_desc.lower()
-        text_lower = page_text.lower()
-        combined = scene_lower + ' ' + text_lower
-        
         char1_lower = char1_name.lower()
         char2_lower = char2_name.lower()
         
-        # Extract actions by finding sentences containing character names
-        char1_action = self._extract_character_action(combined, char1_lower, char1_name)
-        char2_action = self._extract_character_action(combined, char2_lower, char2_name)
+        char1_actions = []
+        char2_actions = []
+        env_sentences = []
+        
+        # Lowercasing never adds or removes '.', so both scene lists line up index for index
+        scene_sentences = scene_desc.split('.')
+        sentences_lower = scene_lower.split('.') + page_text.lower().split('.')
+        
+        for index, sentence_lower in enumerate(sentences_lower):
+            has_char1 = char1_lower in sentence_lower
+            has_char2 = char2_lower in sentence_lower
+            
+            # Actions come from sentences naming the character, in the scene or the text
+            if has_char1:
+                self._add_character_action(char1_actions, sentence_lower, char1_name)
+            if has_char2:
+                self._add_character_action(char2_actions, sentence_lower, char2_name)
+            
+            # Environment comes from the scene only: keep sentences that describe
+            # the setting or don't involve either character
+            if index < len(scene_sentences):
+                has_setting = _SETTING_RE.search(sentence_lower) is not None
+                if has_setting or not (has_char1 or has_char2):
+                    env_sentences.append(scene_sentences[index].strip())
+        
+        # Use up to 2 action descriptions per character
+        char1_action = ', '.join(char1_actions[:2]) or 'standing confidently'
+        char2_action = ', '.join(char2_actions[:2]) or 'standing confidently'
         
         # Extract positioning information
-        positioning = self._extract_positioning(scene_desc, char1_name, char2_name)
+        positioning = self._extract_positioning(scene_lower, char1_name, char2_name)
         
-        # Extract environment description (everything that's not character-specific)
-        environment_desc = self._extract_environment(scene_desc, char1_name, char2_name)
+        if env_sentences:
+            environment_desc = '. '.join(env_sentences)
+        else:
+            # Fallback
+            environment_desc = 'fantasy illustration, cinematic lighting, high detail'
         
         return char1_action, char2_action, environment_desc, positioning
     
-    def _extract_character_action(self, text, char_name_lower, char_name):
-        """Extract action description for a specific character"""
-        # Look for sentences containing the character's name
-        sentences = text.split('.')
-        actions = []
-        
-        for sentence in sentences:
-            if char_name_lower in sentence.lower():
-                # Extract key action words
-                sentence = sentence.strip()
-                # Remove character name for cleaner prompt
-                sentence = sentence.replace(char_name, '').strip()
-                if sentence and len(sentence) > 5:
-                    actions.append(sentence)
-        
-        if actions:
-            return ', '.join(actions[:2])  # Use up to 2 action descriptions
-        return 'standing confidently'
+    def _add_character_action(self, actions, sentence, char_name):
+        """Add a sentence to a character's action list if there's enough left of it"""
+        # Remove character name for cleaner prompt
+        sentence = sentence.strip().replace(char_name, '').strip()
+        if len(sentence) > 5:
+            actions.append(sentence)
     
-    def _extract_positioning(self, scene_desc, char1_name, char2_name):
-        """Extract positioning information (left/right, foreground/background)"""
-        scene_lower = scene_desc.lower()
-        
+    def _extract_positioning(self, scene_lower, char1_name, char2_name):
+        """Extract positioning information (left/right, foreground/background) from the lowercased scene"""
         position_map = {
             char1_name: '',
             char2_name: ''
         }
-        
-        # Check for explicit positioning
-        for char_name in [char1_name, char2_name]:
-            char_lower = char_name.lower()
-            if 'on the left' in scene_lower and char_lower in scene_lower[:scene_lower.find('on the left') + 20]:
-                position_map[char_name] = 'on the left'
-            elif 'on the right' in scene_lower and char_lower in scene_lower[:scene_lower.find('on the right') + 20]:
-                position_map[char_name] = 'on the right'
-            elif 'center' in scene_lower and char_lower in scene_lower[:scene_lower.find('center') + 20]:
-                position_map[char_name] = 'in the center'
-            elif 'foreground' in scene_lower and char_lower in scene_lower[:scene_lower.find('foreground') + 20]:
-                position_map[char_name] = 'in the foreground'
-            elif 'background' in scene_lower and char_lower in scene_lower[:scene_lower.find('background') + 20]:
-                position_map[char_name] = 'in the background'
+        names_by_lower = {char1_name.lower(): char1_name, char2_name.lower(): char2_name}
+        phrases_found = {char1_name: set(), char2_name: set()}
+        
+        # Check for explicit positioning: a position phrase within 40
+        # characters after a name belongs to every character named since the
+        # previous phrase, so "Olive and Tobias stand in the center" places
+        # both. The first name after a phrase starts a new group.
+        pending_names = []
+        phrase_consumed = False
+        name_end = 0
+        for match in self._position_re.finditer(scene_lower):
+            if match.group(1):
+                if phrase_consumed:
+                    pending_names.clear()
+                    phrase_consumed = False
+                pending_names.append(names_by_lower[match.group(1)])
+                name_end = match.end()
+            elif pending_names and match.start() - name_end <= 40:
+                for char_name in pending_names:
+                    phrases_found[char_name].add(match.group(2))
+                phrase_consumed = True
+        
+        # Resolve each character's phrases in POSITION_LABELS priority order
+        # (left/right before center before foreground/background)
+        for char_name, phrases in phrases_found.items():
+            position_map[char_name] = next(
+                (label for phrase, label in POSITION_LABELS.items() if phrase in phrases), ''
+            )
         
         # Default positioning if not specified
         if not position_map[char1_name]:
@@ -291,175 +493,92 @@ class StoryGenerator:
         
         return f"{char1_name} {position_map[char1_name]}, {char2_name} {position_map[char2_name]}"
     
-    def _extract_environment(self, scene_desc, char1_name, char2_name):
-        """Extract environment/setting description without character-specific details"""
-        # Remove character names and their immediate context
-        env_desc = scene_desc
-        
-        # List of phrases to remove that are character-specific
-        char_phrases = [
-            char1_name, char2_name,
-            'he ', 'she ', 'his ', 'her ',
-            'stands', 'sitting', 'kneeling', 'crouching',
-            'holding', 'wielding', 'wearing'
-        ]
-        
-        # Extract setting-related phrases
-        setting_keywords = [
-            'forest', 'clearing', 'village', 'temple', 'ruins', 'cave',
-            'lighting', 'sunlight', 'shadows', 'atmosphere', 'mood',
-            'cinematic', 'illustration', 'fantasy', 'dramatic'
-        ]
-        
-        # Simple extraction - keep sentences with setting keywords
-        sentences = scene_desc.split('.')
-        env_sentences = []
-        
-        for sentence in sentences:
-            sentence_lower = sentence.lower()
-            has_setting = any(keyword in sentence_lower for keyword in setting_keywords)
-            has_character = char1_name.lower() in sentence_lower or char2_name.lower() in sentence_lower
-            
-            if has_setting or not has_character:
-                env_sentences.append(sentence.strip())
-        
-        if env_sentences:
-            return '. '.join(env_sentences)
-        
-        # Fallback
-        return 'fantasy illustration, cinematic lighting, high detail'
-    
     def _build_character_prompt(self, lora_file, strength, trigger_word, char_name, action, outfit_cue, prompt_keywords):
         """Build a character-specific prompt"""
-        prompt_parts = [
-            f"<lora:{lora_file}:{strength}>",
-            trigger_word
-        ]
-        
-        if action and action != 'standing confidently':
-            prompt_parts.append(action)
-        else:
-            prompt_parts.append('standing confidently')
+        prompt = f"<lora:{lora_file}:{strength}> {trigger_word} {action or 'standing confidently'}"
         
         if outfit_cue:
-            prompt_parts.append(outfit_cue)
+            prompt += f" {outfit_cue}"
         
         if prompt_keywords:
-            prompt_parts.append(prompt_keywords)
-
-        return ' '.join(prompt_parts)
+            prompt += f" {prompt_keywords}"
+        
+        return prompt
     
     def _build_scene_prompt(self, environment_desc, positioning, char1_name, char2_name):
         """Build the scene/environment prompt"""
-        prompt_parts = []
-        
-        if environment_desc:
-            prompt_parts.append(environment_desc)
+        prompt = f"{environment_desc}, " if environment_desc else ''
         
         if positioning:
-            prompt_parts.append(positioning)
+            prompt += f"{positioning}, "
         
         # Add quality and style descriptors
-        prompt_parts.append('cinematic lighting, fantasy illustration, high detail')
-        
-        return ', '.join(prompt_parts)
+        return prompt + 'cinematic lighting, fantasy illustration, high detail'
     
     def generate_story_gemini(self, theme=None):
         """Generate story using Google Gemini API"""
         url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent"
         
-        character_context = self.format_characters_for_prompt()
-        
-        char1_name = self.characters.get('character_1', {}).get('fantasy_name', 'Character 1')
-        char2_name = self.characters.get('character_2', {}).get('fantasy_name', 'Character 2')
-        
-        prompt = f"""{character_context}
-
-Write an exciting high fantasy adventure story featuring these two characters. 
-The story should be suitable for display as a picture book with 10-12 pages.
-
-REQUIREMENTS:
-- Write exactly 10 distinct scenes/pages
-- Each page should be 2-3 sentences of narrative
-- Each page should be a clear, visually distinct scene
-- Show the characters' personalities and their relationship dynamic
-- Include character-appropriate actions (their quirks, fighting styles, etc.)
-- Build to a satisfying conclusion
-- Use vivid, descriptive language suitable for image generation
-{f"- Story theme: {theme}" if theme else ""}
-
-IMPORTANT: Make sure the story reflects their personalities:
-- {char1_name}'s cautious but curious nature, love of fine things, trust issues
-- {char2_name}'s protective caring nature, connection to nature/deity, maternal strength
-- Their contrasting approaches but strong partnership
-
-Format your response as a JSON array with this structure:
-[
-  {{
-    "page": 1,
-    "text": "The narrative text for this page (2-3 sentences)",
-    "scene_description": "Detailed visual description of the scene for image generation. "
-  }},
-  ...
-]
-
-CRITICAL: The scene_description must be EXTREMELY EXPLICIT and detailed:
-- State EXACTLY which character is doing what action (use their names: {char1_name} or {char2_name})
-- Do not use personal pronouns without referencing the character's name in the same sentence.
-- Describe WHERE each character is positioned (left/right/center, foreground/background)
-- Specify WHAT each character is holding or wearing
-- Describe the setting, lighting, and mood
-- Be precise about body positions and actions
-- If a character holds a weapon, specify WHICH character and WHICH hand
-
-EXAMPLE of a good scene_description:
-"{char2_name} stands in the foreground on the left, holding a glowing sword raised high in her right hand, shield on her left arm. {char1_name} crouches to the right in the background, daggers drawn, watching the shadows. Ancient stone temple interior, torchlight casting dramatic shadows, tense atmosphere."
-"{char2_name} wears her paladin armor and has a gentle smile."
-"{char1_name}'s Lightning Dagger is clipped to his belt, crackling faintly."
-
-BAD scene_description (too vague):
-"The heroes face danger in the temple"
-"She wears her paladin armor and has a gentle smile."
-"His Lightning Dagger is clipped to his belt, crackling faintly."
-
-Include character names, specific positions, and explicit actions in EVERY scene description!"""
+        # The static instructions are rendered once in __init__ and sent as the
+        # systemInstruction, so repeated calls share an identical prefix that
+        # Gemini can cache; only the short story request varies
+        prompt = STORY_REQUEST
+        if theme:
+            prompt += f"\nStory theme: {theme}"
 
         headers = {
             'Content-Type': 'application/json',
         }
         
         data = {
+            "systemInstruction": {
+                "parts": [{"text": self._system_instruction}]
+            },
             "contents": [{
                 "parts": [{"text": prompt}]
             }],
             "generationConfig": {
                 "temperature": 0.9,
                 "maxOutputTokens": 8192,
+                # Ask for bare JSON so the page array can be parsed as-is
+                "responseMimeType": "application/json",
             }
         }
         
-        response = requests.post(
+        response = self._session.post(
             f"{url}?key={self.api_key}",
             headers=headers,
-            json=data
+            json=data,
+            # (connect, read): a stalled connection fails into a retry instead of hanging
+            timeout=(10, 120)
         )
         
         if response.status_code == 200:
-            result = response.json()
+            # Parse the raw body directly; response.json() would decode it to str first
+            result = json.loads(response.content)
             text = result['candidates'][0]['content']['parts'][0]['text']
             
-            # Extract JSON from response (handle markdown code blocks)
-            if '```json' in text:
-                text = text.split('```json')[1].split('```')[0].strip()
-            elif '```' in text:
-                text = text.split('```')[1].split('```')[0].strip()
+            # Extract JSON from response (handle markdown code blocks in case
+            # the model wraps its output despite responseMimeType)
+            start = text.find('```json')
+            if start != -1:
+                start += 7
+            else:
+                start = text.find('```')
+                if start != -1:
+                    start += 3
+            
+            if start != -1:
+                end = text.find('```', start)
+                text = text[start:end if end != -1 else len(text)].strip()
             
             story_pages = json.loads(text)
             
             # Add prompt fields to each page
             print("\nGenerating prompt fields for each page...")
+            build_page_prompts = self._page_prompt_builder
             for page in story_pages:
-                prompts = self.build_page_prompts(page)
+                prompts = build_page_prompts(page)
                 page.update(prompts)
                 # Remove old scene_description field (now replaced by prompts)
                 # Keep it for backward compatibility or remove it
@@ -469,12 +588,41 @@ Include character names, specific positions, and explicit actions in EVERY scene
         else:
             raise Exception(f"API Error: {response.status_code} - {response.text}")
     
+    def generate_stories_gemini(self, themes, max_workers=4):
+        """
+        Generate several stories at once, one Gemini request per theme
+        
+        Each request spends nearly all of its 30-60 seconds waiting on the
+        network, so running them on a thread pool makes a batch take about
+        as long as a single story.
+        
+        Args:
+            themes: List of story themes (None for no theme)
+            max_workers: Maximum number of requests in flight at once
+        
+        Returns:
+            List of story page lists, in the same order as themes. A story
+            that failed is None in its slot (the error is printed), so the
+            rest of the batch can still be saved.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.generate_story_gemini, theme) for theme in themes]
+        
+        stories = []
+        for theme, future in zip(themes, futures):
+            try:
+                stories.append(future.result())
+            except Exception as e:
+                print(f"✗ Story failed (theme: {theme}): {e}")
+                stories.append(None)
+        
+        return stories
+    
     def save_story(self, story_pages, output_dir='stories'):
         """Save generated story to file"""
         Path(output_dir).mkdir(exist_ok=True)
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{output_dir}/story_{timestamp}.json"
         
         story_data = {
             'generated_at': timestamp,
@@ -482,11 +630,49 @@ Include character names, specific positions, and explicit actions in EVERY scene
             'pages': story_pages
         }
         
-        with open(filename, 'w') as f:
-            json.dump(story_data, f, indent=2)
+        # Stored compact; the files are read by the image generators, not by people.
+        # json.dumps takes the C encoder in one shot, where json.dump streams
+        # the pure-Python encoder's chunks into the file one by one
+        data = json.dumps(story_data, separators=(',', ':')).encode('utf-8')
+        
+        # Write to a uniquely named temp file and flush it to disk, then publish
+        # it under its final name, so a crash never leaves a half-written (or
+        # empty) story behind. BufferedWriter keeps writing until all of data
+        # is out (one syscall at this size)
+        fd, tmp_filename = tempfile.mkstemp(dir=output_dir, prefix='.story_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates the file owner-only; stories are ordinary readable files
+            os.chmod(tmp_filename, 0o644)
+            filename = self._publish_story_file(tmp_filename, output_dir, timestamp)
+        finally:
+            os.unlink(tmp_filename)
         
         print(f"Story saved to: {filename}")
+        print(f"To read it: python -m json.tool {filename}")
         return filename
+    
+    def _publish_story_file(self, tmp_filename, output_dir, timestamp):
+        """
+        Hard-link a finished story file to the first free name for its timestamp
+        
+        A batch from generate_stories_gemini can finish several stories within
+        the same second, so later ones get a _2, _3, ... suffix. os.link never
+        replaces an existing file, so concurrent saves can't take the same name.
+        """
+        suffix = ''
+        counter = 1
+        while True:
+            filename = f"{output_dir}/story_{timestamp}{suffix}.json"
+            try:
+                os.link(tmp_filename, filename)
+                return filename
+            except FileExistsError:
+                counter += 1
+                suffix = f"_{counter}"
 
 # Example usage
 if __name__ == "__main__":
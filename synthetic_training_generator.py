@@ -1,29 +1,144 @@
 import os
 import json
+import shutil
+import threading
+import time
 import fal_client
 from pathlib import Path
 from PIL import Image
-from io import BytesIO
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+# Sustained fal request rate and how many requests may go out in a burst
+FAL_REQUESTS_PER_SECOND = 2
+FAL_BURST = 4
+
+# Seconds between status polls while waiting on a queued generation. These
+# polls skip the rate limiter, so they're kept slow instead of fal_client's
+# 0.1s default, which would outpace the submit rate with several workers
+FAL_POLL_INTERVAL = 1.0
+
+# Existing images at least this big are kept when a run is resumed
+MIN_EXISTING_IMAGE_BYTES = 10_000
+
+# Approximate fal price of one FLUX dev image, used for the cost budget
+PER_IMAGE_USD = 0.035
+
+# Physical details from a character's visual design, in prompt order
+VISUAL_FIELDS = ('face', 'hair', 'eyes', 'build', 'skin', 'distinctive')
+
+# Angle/expression/lighting combinations, one per training image
+VARIATIONS = (
+    # Front-facing portraits (5-6 images)
+    {"angle": "front view, looking at camera", "expression": "slight smile", "lighting": "soft natural lighting"},
+    {"angle": "front view, direct gaze", "expression": "serious expression", "lighting": "dramatic lighting"},
+    {"angle": "front view, head slightly tilted", "expression": "gentle smile", "lighting": "golden hour lighting"},
+    {"angle": "front view, confident pose", "expression": "determined look", "lighting": "bright daylight"},
+    {"angle": "front view portrait", "expression": "thoughtful expression", "lighting": "studio lighting"},
+    {"angle": "front view, neutral expression", "expression": "calm demeanor", "lighting": "even lighting"},
+    
+    # 3/4 view (5-6 images)
+    {"angle": "three-quarter view", "expression": "slight smile", "lighting": "side lighting"},
+    {"angle": "three-quarter angle, looking to the side", "expression": "contemplative", "lighting": "soft lighting"},
+    {"angle": "3/4 view from right side", "expression": "friendly smile", "lighting": "natural daylight"},
+    {"angle": "three-quarter view from left", "expression": "focused expression", "lighting": "dramatic shadows"},
+    {"angle": "3/4 angle looking over shoulder", "expression": "confident look", "lighting": "backlit"},
+    {"angle": "three-quarter portrait", "expression": "serene expression", "lighting": "warm lighting"},
+    
+    # Side profiles (3-4 images)
+    {"angle": "side profile view", "expression": "neutral expression", "lighting": "profile lighting"},
+    {"angle": "profile from left side", "expression": "thoughtful look", "lighting": "rim lighting"},
+    {"angle": "right side profile", "expression": "calm demeanor", "lighting": "soft side light"},
+    {"angle": "profile view, looking distance", "expression": "observant", "lighting": "natural light"},
+    
+    # Action poses (3-4 images)
+    {"angle": "dynamic pose, front angle", "expression": "determined", "lighting": "action lighting"},
+    {"angle": "standing confidently", "expression": "ready for adventure", "lighting": "heroic lighting"},
+    {"angle": "in motion, 3/4 view", "expression": "focused", "lighting": "dramatic lighting"},
+    {"angle": "action stance", "expression": "alert expression", "lighting": "dynamic shadows"},
+)
+
+PROMPT_SUFFIX = "high quality portrait, professional photography, detailed, sharp focus, fantasy character art"
+
+# Everything in each variation's prompt after the character description, plus
+# its progress-line description, built once at import
+_VARIATION_PROMPTS = tuple(
+    (', ' + ', '.join((var['angle'], var['expression'], var['lighting'], PROMPT_SUFFIX)),
+     f"{var['angle']}, {var['expression']}")
+    for var in VARIATIONS
+)
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a request may be sent"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)
 
 class SyntheticTrainingDataGenerator:
-    def __init__(self, api_key, characters_file='characters.json'):
+    def __init__(self, api_key, characters_file='characters.json', cost_budget_usd=2.00):
         os.environ['FAL_KEY'] = api_key
+        
+        # One pooled session for all image downloads, so each one reuses an
+        # open connection to fal's CDN instead of paying TCP + TLS again
+        self.session = requests.Session()
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504]
+        )
+        self.session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retries))
+        
+        # Shared by every worker thread so the combined request rate stays under fal's limit
+        self.rate_limiter = TokenBucket(FAL_REQUESTS_PER_SECOND, FAL_BURST)
+        
+        # Estimated spend across every training set this generator runs;
+        # nothing more is submitted once the next image would exceed the budget
+        self.cost_budget_usd = cost_budget_usd
+        self.spent_usd = 0.0
+        self._budget_lock = threading.Lock()
+        
         self.characters = self.load_characters(characters_file)
+        
+        # Each character's base description, built once for every run
+        self._character_descriptions = {
+            character_key: self._build_character_description(self.characters[character_key])
+            for character_key in ('character_1', 'character_2')
+        }
     
     def load_characters(self, file_path):
         """Load character profiles"""
         with open(file_path, 'r') as f:
             return json.load(f)
     
-    def generate_character_training_set(self, character_key, num_images=20):
+    def generate_character_training_set(self, character_key, num_images=20, max_workers=4):
         """
         Generate a set of training images for a character
         
         Args:
             character_key: 'character_1' or 'character_2'
             num_images: Number of training images to generate (15-20 recommended)
+            max_workers: Maximum number of finished images downloaded at once
         """
         
         char = self.characters[character_key]
@@ -34,57 +149,72 @@ class SyntheticTrainingDataGenerator:
         print(f"GENERATING TRAINING SET: {char_name}")
         print(f"{'='*60}")
         print(f"Target: {num_images} images")
-        print(f"This will take 10-15 minutes and cost ~$0.70-1.00\n")
+        print(f"This will take 3-5 minutes and cost ~$0.70-1.00\n")
         
         # Create output directory
         output_dir = Path(f"lora_training/{character_key}")
         output_dir.mkdir(parents=True, exist_ok=True)
         
         # Build base character description
-        base_description = self._build_character_description(char)
+        base_description = self._character_descriptions[character_key]
         
         # Generate varied prompts for different angles/expressions/poses
         prompts = self._generate_varied_prompts(base_description, num_images)
         
         print(f"Generating {len(prompts)} images...\n")
         
+        output_paths = [output_dir / f"{i:02d}.jpg" for i in range(1, len(prompts) + 1)]
+        
         generated_count = 0
         
-        for i, prompt_data in enumerate(prompts, 1):
-            print(f"Image {i}/{len(prompts)}: {prompt_data['description']}")
-            
-            try:
-                # Generate image using FLUX
-                result = fal_client.subscribe(
-                    "fal-ai/flux/dev",  # Using FLUX dev for high quality
-                    arguments={
-                        "prompt": prompt_data['prompt'],
-                        "negative_prompt": "extremely pointed ears, very long ears, exaggerated elf ears",
-                        "image_size": "square_hd",  # 1024x1024 good for training
-                        "num_inference_steps": 28,
-                        "guidance_scale": 3.5,
-                        "num_images": 1
-                    }
-                )
+        # Queue every generation on fal up front (paced by the rate limiter) so
+        # they all run server-side while the workers wait on and download
+        # whichever finish first
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            skipped_count = 0
+            for i, (prompt_data, output_path) in enumerate(zip(prompts, output_paths), 1):
+                # Keep images from an earlier, interrupted run instead of paying for them again
+                if output_path.exists() and output_path.stat().st_size >= MIN_EXISTING_IMAGE_BYTES:
+                    print(f"Image {i}/{len(prompts)}: {prompt_data['description']}")
+                    print(f"  ✓ Already exists: {output_path}")
+                    generated_count += 1
+                    continue
                 
-                image_url = result['images'][0]['url']
+                # Keep going once the budget runs out, so later images that
+                # already exist are still counted
+                if not self._reserve_budget():
+                    skipped_count += 1
+                    continue
                 
-                # Download and save
-                img_response = requests.get(image_url)
-                img = Image.open(BytesIO(img_response.content))
+                try:
+                    handle = self._submit_image(prompt_data)
+                except Exception as e:
+                    # Nothing was queued, so nothing was spent
+                    self._release_budget()
+                    # Report failed submissions alongside the other results
+                    future = Future()
+                    future.set_exception(e)
+                else:
+                    future = executor.submit(self._save_image, handle, output_path)
+                futures[future] = (i, prompt_data)
+            
+            if skipped_count:
+                print(f"\n⚠ Cost budget of ${self.cost_budget_usd:.2f} reached, "
+                      f"skipped {skipped_count} images\n")
+            
+            for future in as_completed(futures):
+                i, prompt_data = futures[future]
+                print(f"Image {i}/{len(prompts)}: {prompt_data['description']}")
                 
-                output_path = output_dir / f"{i:02d}.jpg"
-                img.save(output_path, quality=95)
+                try:
+                    output_path = future.result()
+                except Exception as e:
+                    print(f"  ✗ Error: {e}")
+                    continue
                 
                 print(f"  ✓ Saved: {output_path}")
                 generated_count += 1
-                
-                # Small delay to avoid rate limits
-                time.sleep(2)
-                
-            except Exception as e:
-                print(f"  ✗ Error: {e}")
-                continue
         
         print(f"\n{'='*60}")
         print(f"✓ Generated {generated_count}/{len(prompts)} images")
@@ -93,82 +223,106 @@ class SyntheticTrainingDataGenerator:
         
         return generated_count
     
+    def _reserve_budget(self):
+        """Charge one image to the cost budget; False if it would go over"""
+        with self._budget_lock:
+            # Rounded so a budget that's an exact multiple of the price isn't missed by float error
+            if round(self.spent_usd + PER_IMAGE_USD, 6) > self.cost_budget_usd:
+                return False
+            self.spent_usd += PER_IMAGE_USD
+            return True
+    
+    def _release_budget(self):
+        """Refund an image charged by _reserve_budget that was never queued"""
+        with self._budget_lock:
+            self.spent_usd -= PER_IMAGE_USD
+    
+    def _submit_image(self, prompt_data):
+        """Queue one training image on FLUX and return its fal request handle"""
+        return self._submit_rate_limited({
+            "prompt": prompt_data['prompt'],
+            "negative_prompt": "extremely pointed ears, very long ears, exaggerated elf ears",
+            "image_size": "square_hd",  # 1024x1024 good for training
+            "num_inference_steps": 28,
+            "guidance_scale": 3.5,
+            "num_images": 1
+        })
+    
+    def _save_image(self, handle, output_path):
+        """Wait for a queued generation to finish and save its image to output_path"""
+        result = handle.get(interval=FAL_POLL_INTERVAL)
+        image_url = result['images'][0]['url']
+        
+        # Download to a temporary file and rename it into place, so an
+        # interrupted run never leaves a truncated image that looks complete
+        temp_path = output_path.with_name(output_path.name + '.part')
+        with self.session.get(image_url, stream=True, timeout=30) as img_response:
+            img_response.raise_for_status()
+            # Reading .raw bypasses requests' decoding, so undo any gzip/deflate here
+            img_response.raw.decode_content = True
+            
+            if img_response.headers.get('Content-Type', '').startswith('image/jpeg'):
+                # Already a JPEG, so write the bytes through as they arrive
+                # rather than decoding and re-encoding the whole image
+                with open(temp_path, 'wb') as f:
+                    shutil.copyfileobj(img_response.raw, f, 64 * 1024)
+            else:
+                # Other formats still need converting, decoded straight from the stream
+                with Image.open(img_response.raw) as img:
+                    # If it turns out to be a JPEG after all (mislabelled, or larger
+                    # than the 1024x1024 we ask for), let libjpeg decode at that size
+                    img.draft('RGB', (1024, 1024))
+                    img.convert('RGB').save(temp_path, 'JPEG', quality=95)
+        
+        os.replace(temp_path, output_path)
+        return output_path
+    
+    def _submit_rate_limited(self, arguments):
+        """
+        Queue a FLUX generation, pacing requests through the rate limiter
+        
+        Rate-limit responses aren't retried here: fal_client.submit already
+        retries 408/409/429 itself, with jittered exponential backoff.
+        """
+        self.rate_limiter.acquire()
+        # Using FLUX dev for high quality
+        return fal_client.submit("fal-ai/flux/dev", arguments=arguments)
+    
     def _build_character_description(self, char):
         """Build detailed character description from profile"""
         visual = char.get('visual_design', char.get('appearance', {}))
         
-        description = f"{char['fantasy_name']}, {char.get('race', 'human')} {char.get('class', 'adventurer')}"
+        parts = [f"{char['fantasy_name']}, {char.get('race', 'human')} {char.get('class', 'adventurer')}"]
         
         # Add physical details
         if isinstance(visual, dict):
-            if 'face' in visual:
-                description += f", {visual['face']}"
-            if 'hair' in visual:
-                description += f", {visual['hair']}"
-            if 'eyes' in visual:
-                description += f", {visual['eyes']}"
-            if 'build' in visual:
-                description += f", {visual['build']}"
-            if 'skin' in visual:
-                description += f", {visual['skin']}"
-            if 'distinctive' in visual:
-                description += f", {visual['distinctive']}"
+            parts.extend(visual[field] for field in VISUAL_FIELDS if field in visual)
             if 'typical_outfit' in visual:
-                description += f", wearing {visual['typical_outfit']}"
+                parts.append(f"wearing {visual['typical_outfit']}")
         
-        return description
+        return ', '.join(parts)
     
     def _generate_varied_prompts(self, base_description, num_images):
         """Generate varied prompts for different angles, expressions, and scenarios"""
-        
-        variations = [
-            # Front-facing portraits (5-6 images)
-            {"angle": "front view, looking at camera", "expression": "slight smile", "lighting": "soft natural lighting"},
-            {"angle": "front view, direct gaze", "expression": "serious expression", "lighting": "dramatic lighting"},
-            {"angle": "front view, head slightly tilted", "expression": "gentle smile", "lighting": "golden hour lighting"},
-            {"angle": "front view, confident pose", "expression": "determined look", "lighting": "bright daylight"},
-            {"angle": "front view portrait", "expression": "thoughtful expression", "lighting": "studio lighting"},
-            {"angle": "front view, neutral expression", "expression": "calm demeanor", "lighting": "even lighting"},
-            
-            # 3/4 view (5-6 images)
-            {"angle": "three-quarter view", "expression": "slight smile", "lighting": "side lighting"},
-            {"angle": "three-quarter angle, looking to the side", "expression": "contemplative", "lighting": "soft lighting"},
-            {"angle": "3/4 view from right side", "expression": "friendly smile", "lighting": "natural daylight"},
-            {"angle": "three-quarter view from left", "expression": "focused expression", "lighting": "dramatic shadows"},
-            {"angle": "3/4 angle looking over shoulder", "expression": "confident look", "lighting": "backlit"},
-            {"angle": "three-quarter portrait", "expression": "serene expression", "lighting": "warm lighting"},
-            
-            # Side profiles (3-4 images)
-            {"angle": "side profile view", "expression": "neutral expression", "lighting": "profile lighting"},
-            {"angle": "profile from left side", "expression": "thoughtful look", "lighting": "rim lighting"},
-            {"angle": "right side profile", "expression": "calm demeanor", "lighting": "soft side light"},
-            {"angle": "profile view, looking distance", "expression": "observant", "lighting": "natural light"},
-            
-            # Action poses (3-4 images)
-            {"angle": "dynamic pose, front angle", "expression": "determined", "lighting": "action lighting"},
-            {"angle": "standing confidently", "expression": "ready for adventure", "lighting": "heroic lighting"},
-            {"angle": "in motion, 3/4 view", "expression": "focused", "lighting": "dramatic lighting"},
-            {"angle": "action stance", "expression": "alert expression", "lighting": "dynamic shadows"},
+        return [
+            {'prompt': base_description + prompt_tail, 'description': description}
+            # Select the right number of variations
+            for prompt_tail, description in _VARIATION_PROMPTS[:num_images]
         ]
-        
-        # Select the right number of variations
-        selected_variations = variations[:num_images]
-        
-        prompts = []
-        for i, var in enumerate(selected_variations, 1):
-            prompt = f"{base_description}, {var['angle']}, {var['expression']}, {var['lighting']}, high quality portrait, professional photography, detailed, sharp focus, fantasy character art"
-            
-            prompts.append({
-                'prompt': prompt,
-                'description': f"{var['angle']}, {var['expression']}"
-            })
-        
-        return prompts
 
 
 # Main execution
 if __name__ == "__main__":
+    import argparse
     from dotenv import load_dotenv
+    
+    parser = argparse.ArgumentParser(description="Generate synthetic LoRA training images for both characters")
+    parser.add_argument('--interactive', action='store_true',
+                        help="generate one character at a time, pausing for review before each")
+    parser.add_argument('--budget', type=float, default=2.00,
+                        help="stop submitting images once the estimated spend would pass this many USD (default: 2.00)")
+    args = parser.parse_args()
+    
     load_dotenv()
     
     api_key = os.getenv('FAL_API_KEY')
@@ -176,7 +330,7 @@ if __name__ == "__main__":
         print("ERROR: Please set FAL_API_KEY in .env file")
         exit(1)
     
-    generator = SyntheticTrainingDataGenerator(api_key)
+    generator = SyntheticTrainingDataGenerator(api_key, cost_budget_usd=args.budget)
     
     print("\n" + "="*60)
     print("SYNTHETIC LoRA TRAINING DATA GENERATOR")
@@ -186,34 +340,52 @@ if __name__ == "__main__":
     print("\nCost estimate:")
     print("  - 20 images per character × 2 characters = 40 images")
     print("  - ~$0.035 per image = ~$1.40 total")
-    print("\nTime estimate: 20-30 minutes total\n")
+    print(f"  - Budget cap: ${args.budget:.2f}")
     
-    print("Press Enter to start, or Ctrl+C to cancel...")
-    input()
-    
-    # Generate training set for Character 1
-    print("\n" + "="*60)
-    print("GENERATING CHARACTER 1")
-    print("="*60)
-    
-    count1 = generator.generate_character_training_set('character_1', num_images=20)
-    
-    print("\nCharacter 1 complete! Check the images in lora_training/character_1/")
-    print("Press Enter to continue to Character 2...")
-    input()
-    
-    # Generate training set for Character 2
-    print("\n" + "="*60)
-    print("GENERATING CHARACTER 2")
-    print("="*60)
-    
-    count2 = generator.generate_character_training_set('character_2', num_images=20)
+    if args.interactive:
+        print("\nTime estimate: 10-15 minutes total\n")
+        
+        print("Press Enter to start, or Ctrl+C to cancel...")
+        input()
+        
+        # Generate training set for Character 1
+        print("\n" + "="*60)
+        print("GENERATING CHARACTER 1")
+        print("="*60)
+        
+        count1 = generator.generate_character_training_set('character_1', num_images=20)
+        
+        print("\nCharacter 1 complete! Check the images in lora_training/character_1/")
+        print("Press Enter to continue to Character 2...")
+        input()
+        
+        # Generate training set for Character 2
+        print("\n" + "="*60)
+        print("GENERATING CHARACTER 2")
+        print("="*60)
+        
+        count2 = generator.generate_character_training_set('character_2', num_images=20)
+    else:
+        print("\nTime estimate: 5-10 minutes total\n")
+        
+        # The two sets are independent, so generate them side by side; both
+        # share the generator's rate limiter, keeping the combined request
+        # rate under fal's limit
+        print("\n" + "="*60)
+        print("GENERATING BOTH CHARACTERS")
+        print("="*60)
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future1 = executor.submit(generator.generate_character_training_set, 'character_1', 20)
+            future2 = executor.submit(generator.generate_character_training_set, 'character_2', 20)
+            count1, count2 = future1.result(), future2.result()
     
     print("\n" + "="*60)
     print("✓ ALL TRAINING IMAGES GENERATED!")
     print("="*60)
     print(f"\nCharacter 1: {count1} images in lora_training/character_1/")
     print(f"Character 2: {count2} images in lora_training/character_2/")
+    print(f"Estimated cost: ${generator.spent_usd:.2f}")
     print("\n⚠️  IMPORTANT: Review the images!")
     print("   - Do the characters look consistent across images?")
     print("   - Do they match your vision?")
@@ -4,23 +4,96 @@ Test script for the updated story generator prompt system
 Demonstrates prompt generation without making API calls
 """
 
+import functools
+import io
 import json
+import re
 import sys
+from bisect import bisect_right
+from itertools import accumulate
 from pathlib import Path
 
+# Keyword -> label tables for the simplified extractors, each in priority order
+_POSITION_LABELS = {
+    'on the right': 'on the right',
+    'to the right': 'on the right',
+    'on the left': 'on the left',
+    'to the left': 'on the left',
+    'center': 'in center',
+    'middle': 'in center',
+    'foreground': 'in foreground',
+    'background': 'in background',
+}
+
+_OUTFIT_LABELS = {
+    'green and brown': 'green and brown armor',
+    'dark blue and silver': 'dark blue and silver clothing',
+    'armor': 'armor',
+    'leather': 'leather outfit',
+}
+
+_SETTING_LABELS = {
+    'forest': 'dense forest',
+    'village': 'village in background',
+    'hill': 'hilltop',
+    'crypt': 'dark crypt interior',
+    'tomb': 'dark crypt interior',
+}
+
+_LIGHTING_LABELS = {
+    'sunlight': 'dappled sunlight',
+    'smoke': 'smoke-filled atmosphere',
+}
+
+_ACTION_KEYWORDS = ('kneel', 'stand', 'throw', 'hurl', 'hold', 'sword', 'scowling')
+
+# Every keyword any extractor looks for, so a scene is scanned once per page
+# (longest first, so a phrase wins over a shorter keyword at the same spot)
+_KEYWORD_RE = re.compile('|'.join(sorted(
+    {*_ACTION_KEYWORDS, *_POSITION_LABELS, *_OUTFIT_LABELS, *_SETTING_LABELS, *_LIGHTING_LABELS},
+    key=len, reverse=True
+)))
+
+@functools.lru_cache(maxsize=8)
+def _load_json_cached(file_path):
+    """Parse a JSON file once per path; repeated PromptTester()s share the result"""
+    return json.loads(Path(file_path).read_bytes())
+
+def _first_label(matches, labels, default):
+    """Return the label of the highest-priority keyword among matches"""
+    found = set(matches)
+    for keyword, label in labels.items():
+        if keyword in found:
+            return label
+    return default
+
 # Mock the story generator's prompt building functionality
 class PromptTester:
     def __init__(self, characters_file='characters.json', lora_config_file='lora_config.json'):
         self.characters = self.load_json(characters_file)
         self.loras = self.load_json(lora_config_file)
         
+        # Resolve each character's LoRA settings (with fallbacks) into its
+        # fixed "<lora:file:strength> trigger" prompt prefix once, rather
+        # than rebuilding the defaults for every page
+        self._lora_prefixes = {}
+        for character_key, default_strength in (('character_1', 0.8), ('character_2', 0.75)):
+            if character_key not in self.characters:
+                continue
+            char_name = self.characters[character_key]['fantasy_name']
+            lora = self.loras.get(char_name, {
+                'trigger_word': char_name.lower().replace(' ', '_'),
+                'lora_filename': f"{char_name.replace(' ', '')}.safetensors",
+                'default_strength': default_strength
+            })
+            self._lora_prefixes[char_name] = f"<lora:{lora['lora_filename']}:{lora['default_strength']}> {lora['trigger_word']}"
+        
     def load_json(self, file_path):
         """Load JSON file"""
         if not Path(file_path).exists():
             print(f"Warning: {file_path} not found")
             return {}
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        return _load_json_cached(str(file_path))
     
     def test_prompt_generation(self):
         """Test prompt generation with sample page data"""
@@ -44,67 +117,72 @@ class PromptTester:
             }
         ]
         
-        print("\n" + "="*70)
-        print("PROMPT GENERATION TEST")
-        print("="*70)
+        # Collect the report and write it in one go rather than line by line
+        out = io.StringIO()
+        
+        print("\n" + "="*70, file=out)
+        print("PROMPT GENERATION TEST", file=out)
+        print("="*70, file=out)
         
         char1_name = self.characters['character_1']['fantasy_name']
         char2_name = self.characters['character_2']['fantasy_name']
         
-        print(f"\nCharacters:")
-        print(f"  Character 1: {char1_name}")
-        print(f"  Character 2: {char2_name}")
+        print(f"\nCharacters:", file=out)
+        print(f"  Character 1: {char1_name}", file=out)
+        print(f"  Character 2: {char2_name}", file=out)
         
         if self.loras:
-            print(f"\nLoRA Configuration:")
+            print(f"\nLoRA Configuration:", file=out)
             for char_name, lora_info in self.loras.items():
-                print(f"  {char_name}:")
-                print(f"    Trigger: {lora_info.get('trigger_word', 'N/A')}")
-                print(f"    File: {lora_info.get('lora_filename', 'N/A')}")
-                print(f"    Strength: {lora_info.get('default_strength', 'N/A')}")
+                print(f"  {char_name}:", file=out)
+                print(f"    Trigger: {lora_info.get('trigger_word', 'N/A')}", file=out)
+                print(f"    File: {lora_info.get('lora_filename', 'N/A')}", file=out)
+                print(f"    Strength: {lora_info.get('default_strength', 'N/A')}", file=out)
         
-        print("\n" + "="*70)
-        print("TESTING PROMPT GENERATION FOR SAMPLE PAGES")
-        print("="*70)
+        print("\n" + "="*70, file=out)
+        print("TESTING PROMPT GENERATION FOR SAMPLE PAGES", file=out)
+        print("="*70, file=out)
         
         for test_page in test_pages:
-            print(f"\n{'─'*70}")
-            print(f"PAGE {test_page['page']}")
-            print(f"{'─'*70}")
-            print(f"\nNarrative Text:")
-            print(f"  {test_page['text'][:100]}...")
+            print(f"\n{'─'*70}", file=out)
+            print(f"PAGE {test_page['page']}", file=out)
+            print(f"{'─'*70}", file=out)
+            print(f"\nNarrative Text:", file=out)
+            print(f"  {test_page['text'][:100]}...", file=out)
             
-            print(f"\nOriginal Scene Description:")
-            print(f"  {test_page['scene_description'][:100]}...")
+            print(f"\nOriginal Scene Description:", file=out)
+            print(f"  {test_page['scene_description'][:100]}...", file=out)
             
             # Generate prompts using the actual logic
             prompts = self._build_prompts_for_page(test_page)
             
-            print(f"\n📝 Generated Prompts:")
-            print(f"\n  Character 1 Prompt:")
-            print(f"    {prompts['character_1_prompt']}")
+            print(f"\n📝 Generated Prompts:", file=out)
+            print(f"\n  Character 1 Prompt:", file=out)
+            print(f"    {prompts['character_1_prompt']}", file=out)
             
-            print(f"\n  Character 2 Prompt:")
-            print(f"    {prompts['character_2_prompt']}")
+            print(f"\n  Character 2 Prompt:", file=out)
+            print(f"    {prompts['character_2_prompt']}", file=out)
             
-            print(f"\n  Scene Prompt:")
-            print(f"    {prompts['scene_prompt']}")
+            print(f"\n  Scene Prompt:", file=out)
+            print(f"    {prompts['scene_prompt']}", file=out)
             
-            print(f"\n  Negative Prompt:")
-            print(f"    {prompts['negative_prompt']}")
+            print(f"\n  Negative Prompt:", file=out)
+            print(f"    {prompts['negative_prompt']}", file=out)
             
-            print(f"\n✓ Prompt generation successful for page {test_page['page']}")
-        
-        print("\n" + "="*70)
-        print("TEST COMPLETE")
-        print("="*70)
-        print("\nAll prompts generated successfully!")
-        print("These prompts are ready to use with ComfyUI multi-LoRA workflow.")
-        print("\nNext steps:")
-        print("  1. Verify the prompts match your expectations")
-        print("  2. Adjust LoRA strengths in lora_config.json if needed")
-        print("  3. Run the full story generator to create a complete story")
-        print("  4. Use the generated JSON with your ComfyUI workflow")
+            print(f"\n✓ Prompt generation successful for page {test_page['page']}", file=out)
+        
+        print("\n" + "="*70, file=out)
+        print("TEST COMPLETE", file=out)
+        print("="*70, file=out)
+        print("\nAll prompts generated successfully!", file=out)
+        print("These prompts are ready to use with ComfyUI multi-LoRA workflow.", file=out)
+        print("\nNext steps:", file=out)
+        print("  1. Verify the prompts match your expectations", file=out)
+        print("  2. Adjust LoRA strengths in lora_config.json if needed", file=out)
+        print("  3. Run the full story generator to create a complete story", file=out)
+        print("  4. Use the generated JSON with your ComfyUI workflow", file=out)
+        
+        sys.stdout.write(out.getvalue())
     
     def _build_prompts_for_page(self, page_data):
         """Build prompts for a test page (simplified version)"""
@@ -115,55 +193,48 @@ class PromptTester:
         char1_name = char1['fantasy_name']
         char2_name = char2['fantasy_name']
         
-        # Get LoRA info (with fallbacks)
-        char1_lora = self.loras.get(char1_name, {
-            'trigger_word': char1_name.lower().replace(' ', '_'),
-            'lora_filename': f"{char1_name.replace(' ', '')}.safetensors",
-            'default_strength': 0.8
-        })
-        
-        char2_lora = self.loras.get(char2_name, {
-            'trigger_word': char2_name.lower().replace(' ', '_'),
-            'lora_filename': f"{char2_name.replace(' ', '')}.safetensors",
-            'default_strength': 0.75
-        })
-        
         scene_desc = page_data['scene_description']
+        sentences = scene_desc.split('.')
+        
+        # Lowercase once for every extractor; the split stays aligned with
+        # sentences because lowering never adds or removes a '.'
         scene_lower = scene_desc.lower()
+        sentences_lower = scene_lower.split('.')
+        
+        # Find every keyword in one pass, keeping each hit's span for the
+        # position windows and bucketing it by sentence (keywords never
+        # contain a '.', so each falls inside a single sentence)
+        matches = [(match.start(), match.end(), match.group()) for match in _KEYWORD_RE.finditer(scene_lower)]
+        sentence_ends = list(accumulate(len(sentence_lower) + 1 for sentence_lower in sentences_lower))
+        sentence_keywords = [set() for _ in sentences]
+        for start, _, keyword in matches:
+            sentence_keywords[bisect_right(sentence_ends, start)].add(keyword)
+        
+        # Index the keywords of the sentences that mention each character, so
+        # the action and outfit extractors share one scan for the names
+        mentions = {
+            char_name: [found for sentence, found in zip(sentences, sentence_keywords) if char_name in sentence]
+            for char_name in (char1_name, char2_name)
+        }
         
         # Simple action extraction
-        char1_action = self._extract_simple_action(scene_desc, char1_name)
-        char2_action = self._extract_simple_action(scene_desc, char2_name)
+        char1_action = self._extract_simple_action(mentions[char1_name])
+        char2_action = self._extract_simple_action(mentions[char2_name])
         
         # Extract positioning
-        char1_pos = self._extract_position(scene_desc, char1_name)
-        char2_pos = self._extract_position(scene_desc, char2_name)
+        char1_pos = self._extract_position(scene_lower, matches, char1_name)
+        char2_pos = self._extract_position(scene_lower, matches, char2_name)
         
         # Extract outfit colors
-        char1_outfit = self._extract_outfit_mention(scene_desc, char1_name)
-        char2_outfit = self._extract_outfit_mention(scene_desc, char2_name)
+        char1_outfit = self._extract_outfit_mention(mentions[char1_name])
+        char2_outfit = self._extract_outfit_mention(mentions[char2_name])
         
         # Build character prompts
-        char1_prompt = (
-            f"<lora:{char1_lora['lora_filename']}:{char1_lora['default_strength']}> "
-            f"{char1_lora['trigger_word']}"
-        )
-        if char1_action:
-            char1_prompt += f", {char1_action}"
-        if char1_outfit:
-            char1_prompt += f", {char1_outfit}"
-        
-        char2_prompt = (
-            f"<lora:{char2_lora['lora_filename']}:{char2_lora['default_strength']}> "
-            f"{char2_lora['trigger_word']}"
-        )
-        if char2_action:
-            char2_prompt += f", {char2_action}"
-        if char2_outfit:
-            char2_prompt += f", {char2_outfit}"
+        char1_prompt = ', '.join(part for part in (self._lora_prefixes[char1_name], char1_action, char1_outfit) if part)
+        char2_prompt = ', '.join(part for part in (self._lora_prefixes[char2_name], char2_action, char2_outfit) if part)
         
         # Build scene prompt
-        environment = self._extract_environment_simple(scene_desc)
+        environment = self._extract_environment_simple({keyword for _, _, keyword in matches})
         positioning = f"{char1_name} {char1_pos}, {char2_name} {char2_pos}"
         
         scene_prompt = f"{environment}, {positioning}, cinematic lighting, fantasy illustration, high detail"
@@ -178,29 +249,25 @@ class PromptTester:
             'negative_prompt': negative_prompt
         }
     
-    def _extract_simple_action(self, scene_desc, char_name):
-        """Extract action for character (simplified)"""
-        sentences = scene_desc.split('.')
-        for sentence in sentences:
-            if char_name in sentence:
-                # Look for action verbs
-                sentence_lower = sentence.lower()
-                if 'kneel' in sentence_lower:
-                    return 'kneeling'
-                elif 'stand' in sentence_lower or 'stands' in sentence_lower:
-                    if 'scowling' in sentence_lower:
-                        return 'standing with hand on hip, scowling'
-                    return 'standing confidently'
-                elif 'throw' in sentence_lower or 'hurl' in sentence_lower:
-                    return 'throwing dagger with right hand'
-                elif 'hold' in sentence_lower or 'holds' in sentence_lower:
-                    if 'sword' in sentence_lower:
-                        return 'holding sword in right hand'
+    def _extract_simple_action(self, char_sentences):
+        """Extract action for character from the keywords of sentences mentioning them (simplified)"""
+        for found in char_sentences:
+            # Look for action verbs
+            if 'kneel' in found:
+                return 'kneeling'
+            elif 'stand' in found:
+                if 'scowling' in found:
+                    return 'standing with hand on hip, scowling'
+                return 'standing confidently'
+            elif 'throw' in found or 'hurl' in found:
+                return 'throwing dagger with right hand'
+            elif 'hold' in found:
+                if 'sword' in found:
+                    return 'holding sword in right hand'
         return 'standing'
     
-    def _extract_position(self, scene_desc, char_name):
+    def _extract_position(self, scene_lower, matches, char_name):
         """Extract position (simplified)"""
-        scene_lower = scene_desc.lower()
         char_lower = char_name.lower()
         
         # Find the character mention
@@ -209,59 +276,30 @@ class PromptTester:
             return 'in center'
         
         # Look for position keywords near character name
-        window = scene_lower[max(0, char_index-50):char_index+100]
-        
-        if 'on the right' in window or 'to the right' in window:
-            return 'on the right'
-        elif 'on the left' in window or 'to the left' in window:
-            return 'on the left'
-        elif 'center' in window or 'middle' in window:
-            return 'in center'
-        elif 'foreground' in window:
-            return 'in foreground'
-        elif 'background' in window:
-            return 'in background'
-        
-        return 'in center'
+        window_start, window_end = max(0, char_index-50), char_index+100
+        found = (keyword for start, end, keyword in matches if start >= window_start and end <= window_end)
+        return _first_label(found, _POSITION_LABELS, 'in center')
     
-    def _extract_outfit_mention(self, scene_desc, char_name):
-        """Extract outfit color mentions"""
-        sentences = scene_desc.split('.')
-        for sentence in sentences:
-            if char_name in sentence:
-                sentence_lower = sentence.lower()
-                # Look for clothing/armor mentions
-                if 'green and brown' in sentence_lower:
-                    return 'green and brown armor'
-                elif 'dark blue and silver' in sentence_lower:
-                    return 'dark blue and silver clothing'
-                elif 'armor' in sentence_lower:
-                    return 'armor'
-                elif 'leather' in sentence_lower:
-                    return 'leather outfit'
+    def _extract_outfit_mention(self, char_sentences):
+        """Extract outfit color mentions from the keywords of sentences mentioning a character"""
+        for found in char_sentences:
+            # Look for clothing/armor mentions
+            outfit = _first_label(found, _OUTFIT_LABELS, '')
+            if outfit:
+                return outfit
         return ''
     
-    def _extract_environment_simple(self, scene_desc):
-        """Extract environment description (simplified)"""
+    def _extract_environment_simple(self, found):
+        """Extract environment description from the scene's keywords (simplified)"""
         # Look for setting keywords
-        scene_lower = scene_desc.lower()
-        
-        environments = []
-        
-        if 'forest' in scene_lower:
-            environments.append('dense forest')
-        if 'village' in scene_lower:
-            environments.append('village in background')
-        if 'hill' in scene_lower:
-            environments.append('hilltop')
-        if 'crypt' in scene_lower or 'tomb' in scene_lower:
-            environments.append('dark crypt interior')
+        environments = list(dict.fromkeys(
+            label for keyword, label in _SETTING_LABELS.items() if keyword in found
+        ))
         
         # Look for lighting
-        if 'sunlight' in scene_lower:
-            environments.append('dappled sunlight')
-        elif 'smoke' in scene_lower:
-            environments.append('smoke-filled atmosphere')
+        lighting = _first_label(found, _LIGHTING_LABELS, '')
+        if lighting:
+            environments.append(lighting)
         
         if environments:
             return ', '.join(environments)